@@ -0,0 +1,77 @@
+import time
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from config import Config
+from database import start_of_day, save_download_buckets, save_daily_rollups, get_trending_files
+
+logger = logging.getLogger(__name__)
+
+# Downloads not yet written. Handlers only bump these counters and
+# flush_downloads turns them into one upsert per document. Buckets and
+# rollups are tracked apart so a failure in one never replays the other.
+pending_buckets = Counter()  # (unique_id, day, hour) -> count
+pending_rollups = Counter()  # (day, unique_id) -> count
+
+# Trending only changes when counts are flushed, so it is cached that long
+trending_cache = {"files": None, "expires": 0}
+
+def record_download(unique_id):
+    """Count a download without touching the database"""
+    now = datetime.utcnow()
+    day = start_of_day(now)
+    pending_buckets[(unique_id, day, now.hour)] += 1
+    pending_rollups[(day, unique_id)] += 1
+
+async def flush_pending(pending, save):
+    """Write one pending counter, keeping only what was not written"""
+    if not pending:
+        return
+
+    counts = dict(pending)
+    pending.clear()
+    try:
+        failed = await save(counts)
+    except Exception as e:
+        # Nothing tells us which upserts landed, so all are retried
+        failed = counts
+        logger.error(f"Error flushing download stats: {e}")
+    if failed:
+        pending.update(failed)
+        logger.warning(f"Keeping {len(failed)} download counts for the next flush")
+
+async def flush_downloads():
+    """Write pending download counts to the buckets and daily rollups"""
+    await flush_pending(pending_buckets, save_download_buckets)
+    await flush_pending(pending_rollups, save_daily_rollups)
+
+async def periodic_flush():
+    """Flush download counts every ANALYTICS_FLUSH_INTERVAL seconds"""
+    while True:
+        await asyncio.sleep(Config.ANALYTICS_FLUSH_INTERVAL)
+        await flush_downloads()
+
+async def get_trending():
+    """Get trending files, reading the rollups at most once per flush interval"""
+    now = time.monotonic()
+    if trending_cache["files"] is None or now >= trending_cache["expires"]:
+        trending_cache["files"] = await get_trending_files(Config.TRENDING_DAYS, Config.TRENDING_LIMIT)
+        trending_cache["expires"] = now + Config.ANALYTICS_FLUSH_INTERVAL
+    return trending_cache["files"]
+
+def history_chart(history, days=7):
+    """Render the last days of download totals as a small bar chart"""
+    if not history:
+        return f"No downloads in the last {days} days"
+
+    totals = {bucket["day"]: bucket["total"] for bucket in history}
+    today = start_of_day(datetime.utcnow())
+    peak = max(totals.values())
+    lines = []
+    for offset in range(days - 1, -1, -1):
+        day = today - timedelta(days=offset)
+        total = totals.get(day, 0)
+        bar = "▇" * max(1, round(total / peak * 8)) if total else "·"
+        lines.append(f"`{day.strftime('%m-%d')}` {bar} {total}")
+    return "\n".join(lines)
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+from pyrogram.errors import FloodWait, UserIsBlocked, InputUserDeactivated, UserIsBot
+from config import Config
+from database import (
+    get_active_user_ids, mark_users_inactive, save_broadcast_progress,
+    update_broadcast_status, get_broadcast, get_running_broadcasts
+)
+
+logger = logging.getLogger(__name__)
+
+# Errors meaning the user can never receive messages from the bot.
+# PeerIdInvalid is left out: it only means the peer couldn't be resolved.
+UNREACHABLE_ERRORS = (UserIsBlocked, InputUserDeactivated, UserIsBot)
+
+class RateLimiter:
+    """Space out sends to stay under a global messages-per-second limit"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self._next_slot = 0
+        self._paused_until = 0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        """Wait for the next free send slot outside any pause"""
+        loop = asyncio.get_running_loop()
+        while True:
+            async with self._lock:
+                now = loop.time()
+                slot = max(now, self._next_slot, self._paused_until)
+                self._next_slot = slot + self.interval
+            await asyncio.sleep(slot - now)
+            # A pause that started while we slept also holds back this slot
+            if loop.time() >= self._paused_until:
+                return
+
+    def pause(self, seconds):
+        """Hold back every sender, e.g. after a FloodWait"""
+        now = asyncio.get_running_loop().time()
+        self._paused_until = max(self._paused_until, now + seconds)
+
+# Shared by all broadcasts so together they stay under Telegram's limit
+limiter = RateLimiter(Config.BROADCAST_RATE)
+running_broadcasts = {}
+
+async def send_to_user(client, user_id, chat_id, message_id):
+    """Copy the broadcast message to one user, returning the outcome"""
+    # A FloodWait only means "slow down", so the user is retried until the
+    # send goes through or fails for a reason of its own
+    while True:
+        await limiter.wait()
+        try:
+            await client.copy_message(user_id, chat_id, message_id)
+            return "sent"
+        except FloodWait as e:
+            logger.warning(f"Broadcast FloodWait, sleeping {e.value}s")
+            limiter.pause(e.value)
+        except UNREACHABLE_ERRORS:
+            return "blocked"
+        except Exception as e:
+            logger.error(f"Broadcast to {user_id} failed: {e}")
+            return "failed"
+
+async def send_batch(client, user_ids, chat_id, message_id):
+    """Send to a batch of users with bounded concurrency"""
+    semaphore = asyncio.Semaphore(Config.BROADCAST_CONCURRENCY)
+
+    async def send(user_id):
+        async with semaphore:
+            return user_id, await send_to_user(client, user_id, chat_id, message_id)
+
+    return await asyncio.gather(*(send(user_id) for user_id in user_ids))
+
+def progress_text(broadcast):
+    """Format broadcast progress for the admin"""
+    return (
+        f"📢 **Broadcast** `{broadcast['broadcast_id']}`\n\n"
+        f"Status: {broadcast['status']}\n"
+        f"✅ Sent: {broadcast['sent']}\n"
+        f"🚫 Blocked: {broadcast['blocked']}\n"
+        f"❌ Failed: {broadcast['failed']}"
+    )
+
+async def report_progress(client, broadcast_id):
+    """Update the admin's status message, ignoring edit errors"""
+    broadcast = await get_broadcast(broadcast_id)
+    try:
+        await client.edit_message_text(
+            broadcast["chat_id"],
+            broadcast["status_message_id"],
+            progress_text(broadcast)
+        )
+    except Exception:
+        pass
+
+async def run_broadcast(client, broadcast):
+    """Send a broadcast to every active user, checkpointing after each batch"""
+    broadcast_id = broadcast["broadcast_id"]
+    last_user_id = broadcast["last_user_id"]
+
+    try:
+        while True:
+            user_ids = await get_active_user_ids(last_user_id, Config.BROADCAST_BATCH_SIZE)
+            if not user_ids:
+                break
+
+            results = await send_batch(client, user_ids, broadcast["chat_id"], broadcast["message_id"])
+            blocked = [user_id for user_id, outcome in results if outcome == "blocked"]
+            if blocked:
+                await mark_users_inactive(blocked)
+
+            last_user_id = user_ids[-1]
+            await save_broadcast_progress(
+                broadcast_id,
+                last_user_id,
+                sum(outcome == "sent" for _, outcome in results),
+                len(blocked),
+                sum(outcome == "failed" for _, outcome in results)
+            )
+            await report_progress(client, broadcast_id)
+
+        await update_broadcast_status(broadcast_id, "completed")
+        logger.info(f"Broadcast {broadcast_id} completed")
+    except asyncio.CancelledError:
+        # Left as running so the next start resumes from the checkpoint
+        raise
+    except Exception as e:
+        await update_broadcast_status(broadcast_id, "failed")
+        logger.error(f"Broadcast {broadcast_id} failed: {e}")
+    finally:
+        running_broadcasts.pop(broadcast_id, None)
+
+    await report_progress(client, broadcast_id)
+
+def start_broadcast(client, broadcast):
+    """Run a broadcast in the background unless it is already running"""
+    broadcast_id = broadcast["broadcast_id"]
+    if broadcast_id not in running_broadcasts:
+        running_broadcasts[broadcast_id] = asyncio.create_task(run_broadcast(client, broadcast))
+
+async def resume_broadcasts(client):
+    """Resume broadcasts interrupted by a restart"""
+    for broadcast in await get_running_broadcasts():
+        logger.info(f"Resuming broadcast {broadcast['broadcast_id']} after user {broadcast['last_user_id']}")
+        start_broadcast(client, broadcast)
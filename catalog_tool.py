@@ -0,0 +1,278 @@
+"""Export, import and migrate the file store catalog.
+
+Usage:
+    python catalog_tool.py export --dir backup/
+    python catalog_tool.py import --dir backup/ --batch-size 2000
+    python catalog_tool.py import --dir backup/ --resume
+    python catalog_tool.py migrate
+
+Each collection is written to <dir>/<collection>/part-NNNNN.ndjson.gz
+through a server-side cursor, so memory stays flat however large the
+catalog is. Imports upsert on each collection's natural key and record a
+checkpoint after every batch, so reruns and resumed runs are idempotent.
+migrate rewrites stored file documents to the current schema, including
+the name_tokens search keys. The bot also does this in the background on
+start; migrate additionally drops the old file_name_search text index.
+"""
+import os
+import sys
+import gzip
+import time
+import logging
+import argparse
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+from bson import json_util
+from config import Config
+from database import COLLECTION_KEYS, FILE_SCHEMA_VERSION, UPGRADE_PROJECTION, file_schema_update
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("catalog_tool")
+
+EXPORT_CHECKPOINT = "export.checkpoint.json"
+IMPORT_CHECKPOINT = "import.checkpoint.json"
+DUPLICATE_KEY_ERROR = 11000
+
+# Helper functions
+def part_path(directory, index):
+    """Path of the index-th export part"""
+    return os.path.join(directory, f"part-{index:05d}.ndjson.gz")
+
+def load_checkpoint(path):
+    """Load a checkpoint file, or None if there isn't one"""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json_util.loads(f.read())
+
+def save_checkpoint(path, data):
+    """Write a checkpoint file atomically"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(json_util.dumps(data))
+    os.replace(tmp_path, path)
+
+def log_rate(action, name, docs, started):
+    """Log progress with throughput"""
+    elapsed = time.perf_counter() - started
+    rate = docs / elapsed if elapsed else 0
+    logger.info(f"{action} {name}: {docs} docs in {elapsed:.1f}s ({rate:.0f} docs/sec)")
+
+# Export
+def export_collection(collection, directory, batch_size, part_docs, resume):
+    """Stream a collection into gzipped NDJSON parts, ordered by _id"""
+    os.makedirs(directory, exist_ok=True)
+    checkpoint_path = os.path.join(directory, EXPORT_CHECKPOINT)
+    checkpoint = load_checkpoint(checkpoint_path) if resume else None
+    if checkpoint and checkpoint["done"]:
+        logger.info(f"Export of {collection.name} already complete, skipping")
+        return
+    if not checkpoint:
+        checkpoint = {"last_id": None, "parts": 0, "docs": 0, "done": False}
+
+    criteria = {}
+    if checkpoint["last_id"] is not None:
+        criteria["_id"] = {"$gt": checkpoint["last_id"]}
+    cursor = collection.find(criteria, batch_size=batch_size).sort("_id", 1)
+
+    started = time.perf_counter()
+    exported = 0
+    part = None
+    part_count = 0
+    try:
+        for doc in cursor:
+            if part is None:
+                tmp_path = part_path(directory, checkpoint["parts"]) + ".tmp"
+                part = gzip.open(tmp_path, "wt", encoding="utf-8")
+            part.write(json_util.dumps(doc, json_options=json_util.RELAXED_JSON_OPTIONS))
+            part.write("\n")
+            part_count += 1
+            exported += 1
+
+            if part_count >= part_docs:
+                # Parts only count as exported once they are closed and renamed
+                part.close()
+                os.replace(tmp_path, part_path(directory, checkpoint["parts"]))
+                part = None
+                checkpoint["parts"] += 1
+                checkpoint["docs"] += part_count
+                checkpoint["last_id"] = doc["_id"]
+                part_count = 0
+                save_checkpoint(checkpoint_path, checkpoint)
+                log_rate("Exported", collection.name, exported, started)
+
+        if part is not None:
+            part.close()
+            os.replace(tmp_path, part_path(directory, checkpoint["parts"]))
+            part = None
+            checkpoint["parts"] += 1
+            checkpoint["docs"] += part_count
+            checkpoint["last_id"] = doc["_id"]
+        checkpoint["done"] = True
+        save_checkpoint(checkpoint_path, checkpoint)
+    finally:
+        cursor.close()
+        if part is not None:
+            part.close()
+
+    log_rate("Exported", collection.name, exported, started)
+
+# Import
+def upsert_request(doc, key):
+    """Build an idempotent upsert for doc keyed on key"""
+    doc_id = doc.pop("_id", None)
+    if doc.get(key) is not None:
+        criteria = {key: doc[key]}
+    else:
+        criteria = {"_id": doc_id}
+    update = {"$set": doc}
+    if doc_id is not None:
+        update["$setOnInsert"] = {"_id": doc_id}
+    return UpdateOne(criteria, update, upsert=True)
+
+def ensure_key_index(collection, key):
+    """Index the upsert key so each upsert is an index lookup, not a scan"""
+    try:
+        # Unique also stops concurrent or repeated imports upserting duplicates.
+        # Same options as database.create_key_index, so the bot accepts it.
+        collection.create_index(key, unique=True)
+    except OperationFailure as e:
+        # Existing duplicates or a non-unique index on the key already exist
+        logger.warning(f"Could not create unique index on {collection.name}.{key}: {e}")
+        collection.create_index(key)
+
+def write_batch(collection, batch, key, mode, ordered):
+    """Write one batch of documents"""
+    if mode == "upsert":
+        collection.bulk_write([upsert_request(doc, key) for doc in batch], ordered=ordered)
+        return
+    try:
+        collection.insert_many(batch, ordered=ordered)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if ordered or any(error["code"] != DUPLICATE_KEY_ERROR for error in errors):
+            raise
+        logger.warning(f"Skipped {len(errors)} documents already in {collection.name}")
+
+def import_collection(collection, directory, batch_size, mode, ordered, resume):
+    """Load gzipped NDJSON parts into a collection in batches"""
+    export_checkpoint = load_checkpoint(os.path.join(directory, EXPORT_CHECKPOINT))
+    if not export_checkpoint:
+        logger.error(f"No export found in {directory}")
+        return
+    if not export_checkpoint["done"]:
+        logger.warning(f"Export in {directory} is incomplete, importing finished parts only")
+
+    key = COLLECTION_KEYS[collection.name]
+    checkpoint_path = os.path.join(directory, IMPORT_CHECKPOINT)
+    checkpoint = load_checkpoint(checkpoint_path) if resume else None
+    if not checkpoint:
+        checkpoint = {"part": 0, "line": 0, "docs": 0}
+    ensure_key_index(collection, key)
+
+    started = time.perf_counter()
+    imported = 0
+    for index in range(checkpoint["part"], export_checkpoint["parts"]):
+        skip = checkpoint["line"] if index == checkpoint["part"] else 0
+        batch = []
+        line_no = 0
+        with gzip.open(part_path(directory, index), "rt", encoding="utf-8") as part:
+            for line_no, line in enumerate(part, 1):
+                if line_no <= skip:
+                    continue
+                batch.append(json_util.loads(line))
+                if len(batch) >= batch_size:
+                    write_batch(collection, batch, key, mode, ordered)
+                    imported += len(batch)
+                    checkpoint.update(part=index, line=line_no, docs=checkpoint["docs"] + len(batch))
+                    save_checkpoint(checkpoint_path, checkpoint)
+                    batch = []
+
+            if batch:
+                write_batch(collection, batch, key, mode, ordered)
+                imported += len(batch)
+                checkpoint["docs"] += len(batch)
+
+        checkpoint.update(part=index + 1, line=0)
+        save_checkpoint(checkpoint_path, checkpoint)
+        log_rate("Imported", collection.name, imported, started)
+
+    log_rate("Imported", collection.name, imported, started)
+
+# Migration
+def migrate_files(collection, batch_size):
+    """Rewrite file documents to the current schema in _id ordered batches"""
+    criteria = {"v": {"$ne": FILE_SCHEMA_VERSION}}
+    started = time.perf_counter()
+    migrated = 0
+    last_id = None
+
+    # Already migrated documents drop out of the filter, so an interrupted
+    # run picks up where it stopped when started again
+    while True:
+        if last_id is not None:
+            criteria["_id"] = {"$gt": last_id}
+        batch = list(collection.find(criteria, UPGRADE_PROJECTION).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        collection.bulk_write(
+            [UpdateOne({"_id": doc["_id"]}, file_schema_update(doc)) for doc in batch],
+            ordered=False
+        )
+        migrated += len(batch)
+        last_id = batch[-1]["_id"]
+        log_rate("Migrated", collection.name, migrated, started)
+
+    log_rate("Migrated", collection.name, migrated, started)
+
+    # Searches use name_tokens now, the old text index only slows writes
+    if "file_name_search" in collection.index_information():
+        collection.drop_index("file_name_search")
+        logger.info("Dropped old file_name_search text index")
+
+# CLI
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Export, import or migrate the file store catalog")
+    parser.add_argument("command", choices=["export", "import", "migrate"])
+    parser.add_argument("--dir", help="Directory holding the NDJSON parts")
+    parser.add_argument("--uri", default=Config.MONGODB_URI, help="MongoDB connection URI")
+    parser.add_argument("--db", default=Config.FILE_STORE_DB_NAME, help="Database name")
+    parser.add_argument(
+        "--collections", nargs="+", default=list(COLLECTION_KEYS),
+        choices=list(COLLECTION_KEYS), help="Collections to process"
+    )
+    parser.add_argument("--batch-size", type=int, default=1000, help="Documents per cursor batch / write")
+    parser.add_argument("--part-docs", type=int, default=100000, help="Documents per export part")
+    parser.add_argument(
+        "--mode", choices=["upsert", "insert"], default="upsert",
+        help="upsert on the collection key (idempotent) or plain insert_many"
+    )
+    parser.add_argument("--ordered", action="store_true", help="Use ordered batch writes")
+    parser.add_argument("--resume", action="store_true", help="Continue from the last checkpoint")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command != "migrate" and not args.dir:
+        sys.exit(f"--dir is required for {args.command}")
+    client = MongoClient(args.uri)
+    db = client[args.db]
+
+    try:
+        if args.command == "migrate":
+            migrate_files(db.files, args.batch_size)
+            return
+        for name in args.collections:
+            directory = os.path.join(args.dir, name)
+            if args.command == "export":
+                export_collection(db[name], directory, args.batch_size, args.part_docs, args.resume)
+            else:
+                import_collection(db[name], directory, args.batch_size, args.mode, args.ordered, args.resume)
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
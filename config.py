@@ -20,6 +20,19 @@ class Config:
     MAX_FILE_SIZE = 2 * 1024 * 1024 * 1024  # 2GB
     BATCH_LIMIT = 10  # Max files in batch
     THUMBNAIL_SUPPORT = True
+    SEARCH_PAGE_SIZE = 5  # Results per /search page
+    SEARCH_TTL = 24 * 60 * 60  # Seconds a search's page buttons keep working
+    
+    # Broadcast settings
+    ADMINS = [int(x) for x in os.environ.get("ADMINS", "").split()]
+    BROADCAST_RATE = int(os.environ.get("BROADCAST_RATE", 25))  # Messages per second, all broadcasts
+    BROADCAST_CONCURRENCY = int(os.environ.get("BROADCAST_CONCURRENCY", 10))
+    BROADCAST_BATCH_SIZE = 500  # Users per batch / checkpoint
+    
+    # Analytics settings
+    ANALYTICS_FLUSH_INTERVAL = 10  # Seconds between download counter flushes
+    TRENDING_DAYS = 7
+    TRENDING_LIMIT = 10
     
     # Webhook settings (for Koyeb)
     WEBHOOK = bool(os.environ.get("WEBHOOK", False))
@@ -0,0 +1,503 @@
+import re
+import logging
+import random
+import string
+from datetime import datetime, timedelta
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# MongoDB connections
+# Motor is imported and the client is built on first use, so a cold start
+# does not pay for them before the bot is able to take updates.
+mongo_client = None
+
+def get_mongo_client():
+    """Get the shared Motor client, creating it on first use"""
+    global mongo_client
+    if mongo_client is None:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        mongo_client = AsyncIOMotorClient(Config.MONGODB_URI)
+    return mongo_client
+
+class LazyCollection:
+    """Collection handle that resolves the Motor collection on first access"""
+
+    def __init__(self, db_name, name):
+        self.db_name = db_name
+        self.name = name
+        self._collection = None
+
+    def __getattr__(self, attr):
+        if self._collection is None:
+            self._collection = get_mongo_client()[self.db_name][self.name]
+        return getattr(self._collection, attr)
+
+# Collections
+files_collection = LazyCollection(Config.FILE_STORE_DB_NAME, "files")
+users_collection = LazyCollection(Config.FILE_STORE_DB_NAME, "users")
+broadcasts_collection = LazyCollection(Config.FILE_STORE_DB_NAME, "broadcasts")
+download_stats_collection = LazyCollection(Config.FILE_STORE_DB_NAME, "download_stats")
+daily_stats_collection = LazyCollection(Config.FILE_STORE_DB_NAME, "download_stats_daily")
+searches_collection = LazyCollection(Config.FILE_STORE_DB_NAME, "searches")
+rename_collection = LazyCollection(Config.FILE_RENAME_DB_NAME, "rename_tasks")
+batch_collection = LazyCollection(Config.FILE_RENAME_DB_NAME, "batch_tasks")
+
+# Natural key of each file store collection, indexed unique by both the
+# bot and catalog_tool imports
+COLLECTION_KEYS = {
+    "files": "unique_id",
+    "users": "user_id",
+}
+
+# File document schema
+# v2 drops chat_id/message_id, which nothing reads, and only stores the
+# optional fields when they have a value. download_count appears on the
+# first $inc. Readers must use .get() for the optional fields.
+# v3 adds name_tokens, the search keys derived from file_name.
+FILE_SCHEMA_VERSION = 3
+LEGACY_FILE_FIELDS = ("chat_id", "message_id")
+OPTIONAL_FILE_FIELDS = ("mime_type", "uploaded_by")
+
+# Fields file_schema_update needs to see
+UPGRADE_PROJECTION = {field: 1 for field in LEGACY_FILE_FIELDS + OPTIONAL_FILE_FIELDS + ("file_name",)}
+
+# File names are split on anything but letters and digits, so
+# "my_report_2024.pdf" gives my, report, 2024 and pdf
+TOKEN_SPLIT = re.compile(r"[\W_]+")
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_LENGTH = 20
+
+# Projections, one per use case, so reads only fetch the fields they show
+DOWNLOAD_PROJECTION = {"_id": 0, "file_id": 1, "file_name": 1}
+INFO_PROJECTION = {
+    "_id": 0, "file_name": 1, "file_size": 1, "mime_type": 1,
+    "download_count": 1, "uploaded_at": 1
+}
+LIST_PROJECTION = {"_id": 0, "unique_id": 1, "file_name": 1, "file_size": 1, "download_count": 1}
+TOP_FILES_PROJECTION = {"_id": 0, "file_name": 1, "download_count": 1}
+SEARCH_PROJECTION = {"_id": 0, "unique_id": 1, "file_name": 1, "file_size": 1}
+
+def generate_unique_id():
+    """Generate unique ID for files"""
+    return ''.join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+def search_terms(text):
+    """Split text into lowercase search tokens, capped at MAX_PREFIX_LENGTH"""
+    return [
+        token[:MAX_PREFIX_LENGTH]
+        for token in TOKEN_SPLIT.split(text.lower())
+        if len(token) >= MIN_PREFIX_LENGTH
+    ]
+
+def name_tokens(file_name):
+    """Get every token prefix of a file name, so searches match partial words"""
+    return sorted({
+        token[:length]
+        for token in search_terms(file_name or "")
+        for length in range(MIN_PREFIX_LENGTH, len(token) + 1)
+    })
+
+def build_file_document(file_id, file_name, file_size, mime_type=None, uploaded_by=None):
+    """Build a file document in the current compact schema"""
+    file_data = {
+        "v": FILE_SCHEMA_VERSION,
+        "file_id": file_id,
+        "unique_id": generate_unique_id(),
+        "file_name": file_name,
+        "name_tokens": name_tokens(file_name),
+        "file_size": file_size,
+        "uploaded_at": datetime.utcnow()
+    }
+    if mime_type is not None:
+        file_data["mime_type"] = mime_type
+    if uploaded_by is not None:
+        file_data["uploaded_by"] = uploaded_by
+    return file_data
+
+def file_schema_update(file_data):
+    """Get the update that rewrites a stored file document to the current schema"""
+    unset = {field: "" for field in LEGACY_FILE_FIELDS if field in file_data}
+    unset.update({
+        field: "" for field in OPTIONAL_FILE_FIELDS
+        if field in file_data and file_data[field] is None
+    })
+    update = {"$set": {"v": FILE_SCHEMA_VERSION}}
+    if "file_name" in file_data:
+        update["$set"]["name_tokens"] = name_tokens(file_data["file_name"])
+    if unset:
+        update["$unset"] = unset
+    return update
+
+# Database functions for file store
+async def save_file_to_db(message, file_id, file_name, file_size, mime_type):
+    """Save file information to database"""
+    try:
+        file_data = build_file_document(
+            file_id,
+            file_name,
+            file_size,
+            mime_type,
+            message.from_user.id if message.from_user else None
+        )
+        await files_collection.insert_one(file_data)
+        return file_data["unique_id"]
+    except Exception as e:
+        logger.error(f"Error saving file: {e}")
+        return None
+
+async def get_file_for_download(unique_id):
+    """Get the fields needed to send a file and count the download"""
+    try:
+        return await files_collection.find_one_and_update(
+            {"unique_id": unique_id},
+            {"$inc": {"download_count": 1}},
+            projection=DOWNLOAD_PROJECTION
+        )
+    except Exception as e:
+        logger.error(f"Error getting file: {e}")
+        return None
+
+async def get_file_info(unique_id):
+    """Get the fields shown on a file's info screen"""
+    try:
+        return await files_collection.find_one({"unique_id": unique_id}, INFO_PROJECTION)
+    except Exception as e:
+        logger.error(f"Error getting file info: {e}")
+        return None
+
+async def get_user_files(user_id, limit=10):
+    """Get a user's most recent files"""
+    return await files_collection.find(
+        {"uploaded_by": user_id},
+        LIST_PROJECTION
+    ).sort("uploaded_at", -1).limit(limit).to_list(limit)
+
+async def get_stats(top_limit=5):
+    """Get bot-wide counters and the most downloaded files"""
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    return {
+        "total_files": await files_collection.count_documents({}),
+        "total_users": await users_collection.count_documents({}),
+        "total_renames": await rename_collection.count_documents({}),
+        "today_uploads": await files_collection.count_documents({
+            "uploaded_at": {"$gte": today}
+        }),
+        "top_files": await files_collection.find(
+            {}, TOP_FILES_PROJECTION
+        ).sort("download_count", -1).limit(top_limit).to_list(top_limit)
+    }
+
+async def save_user(user_id, username=None, first_name=None, last_name=None):
+    """Save user information"""
+    try:
+        user_data = {
+            "user_id": user_id,
+            "username": username,
+            "first_name": first_name,
+            "last_name": last_name,
+            "joined_at": datetime.utcnow(),
+            "last_active": datetime.utcnow(),
+            "active": True
+        }
+        await users_collection.update_one(
+            {"user_id": user_id},
+            {"$set": user_data},
+            upsert=True
+        )
+    except Exception as e:
+        logger.error(f"Error saving user: {e}")
+
+async def get_active_user_ids(after_user_id=None, limit=500):
+    """Get the next batch of active user IDs in user_id order"""
+    criteria = {"active": {"$ne": False}}
+    if after_user_id is not None:
+        criteria["user_id"] = {"$gt": after_user_id}
+    users = await users_collection.find(
+        criteria,
+        {"_id": 0, "user_id": 1}
+    ).sort("user_id", 1).limit(limit).to_list(limit)
+    return [user["user_id"] for user in users]
+
+async def mark_users_inactive(user_ids):
+    """Mark users who blocked the bot so broadcasts skip them"""
+    try:
+        await users_collection.update_many(
+            {"user_id": {"$in": list(user_ids)}},
+            {"$set": {"active": False}}
+        )
+    except Exception as e:
+        logger.error(f"Error marking users inactive: {e}")
+
+async def search_files(user_id, query, page=0):
+    """Search a user's files for names containing every term, most downloaded first"""
+    terms = search_terms(query)
+    if not terms:
+        return [], 0
+    try:
+        criteria = {"uploaded_by": user_id, "name_tokens": {"$all": terms}}
+        total = await files_collection.count_documents(criteria)
+        results = await files_collection.find(
+            criteria,
+            SEARCH_PROJECTION
+        ).sort(
+            [("download_count", -1), ("uploaded_at", -1)]
+        ).skip(page * Config.SEARCH_PAGE_SIZE).limit(Config.SEARCH_PAGE_SIZE).to_list(Config.SEARCH_PAGE_SIZE)
+        return results, total
+    except Exception as e:
+        logger.error(f"Error searching files: {e}")
+        return [], 0
+
+async def save_search(user_id, query):
+    """Save a search query so its page buttons can refer to it by ID"""
+    search_id = generate_unique_id()
+    await searches_collection.insert_one({
+        "search_id": search_id,
+        "user_id": user_id,
+        "query": query,
+        "created_at": datetime.utcnow()
+    })
+    return search_id
+
+async def get_search_query(search_id):
+    """Get a saved search query, or None once it has expired"""
+    search = await searches_collection.find_one({"search_id": search_id}, {"_id": 0, "query": 1})
+    return search["query"] if search else None
+
+# Set once upgrade_file_documents has found nothing left to upgrade
+files_upgraded = False
+
+async def upgrade_file_documents(batch_size=500):
+    """Bring older file documents up to the current schema in _id ordered batches"""
+    global files_upgraded
+    from pymongo import UpdateOne
+    
+    criteria = {"v": {"$ne": FILE_SCHEMA_VERSION}}
+    upgraded = 0
+    try:
+        while True:
+            batch = await files_collection.find(
+                criteria, UPGRADE_PROJECTION
+            ).sort("_id", 1).limit(batch_size).to_list(batch_size)
+            if not batch:
+                break
+            await files_collection.bulk_write(
+                [UpdateOne({"_id": doc["_id"]}, file_schema_update(doc)) for doc in batch],
+                ordered=False
+            )
+            upgraded += len(batch)
+            criteria["_id"] = {"$gt": batch[-1]["_id"]}
+        files_upgraded = True
+        if upgraded:
+            logger.info(f"Upgraded {upgraded} file documents to schema v{FILE_SCHEMA_VERSION}")
+    except Exception as e:
+        logger.error(f"Error upgrading file documents: {e}")
+
+def search_ready():
+    """Whether every stored file has its search tokens"""
+    return files_upgraded
+
+async def create_index(collection, keys, **options):
+    """Create one index, logging instead of raising so others still get built"""
+    try:
+        await collection.create_index(keys, **options)
+        return True
+    except Exception as e:
+        logger.error(f"Error creating index {keys} on {collection.name}: {e}")
+        return False
+
+async def create_key_index(collection, key):
+    """Index a collection's natural key, unique where the data allows it"""
+    # catalog_tool builds the same index before imports, so both sides must
+    # ask for identical options or the second create_index is rejected
+    if not await create_index(collection, key, unique=True):
+        await create_index(collection, key)
+
+async def ensure_indexes():
+    """Create the indexes the bot's queries rely on"""
+    for collection in (files_collection, users_collection):
+        await create_key_index(collection, COLLECTION_KEYS[collection.name])
+    await create_index(files_collection, [("uploaded_by", 1), ("uploaded_at", -1)])
+    # The owner leads so every search stays within one user's files
+    await create_index(files_collection, [("uploaded_by", 1), ("name_tokens", 1)])
+    await create_index(broadcasts_collection, "broadcast_id")
+    await create_index(download_stats_collection, [("unique_id", 1), ("day", 1)], unique=True)
+    await create_index(daily_stats_collection, "day", unique=True)
+    await create_index(searches_collection, "search_id")
+    await create_index(searches_collection, "created_at", expireAfterSeconds=Config.SEARCH_TTL)
+
+# Database functions for download analytics
+# One bucket document per file per UTC day:
+# {"unique_id", "day", "total", "hours": {"0".."23": count}}
+# plus one rollup document per UTC day for trending:
+# {"day", "total", "files": {unique_id: count}}
+def start_of_day(moment):
+    """Midnight UTC of the day containing moment"""
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+async def upsert_increments(collection, increments):
+    """Apply {key: (filter, inc)} as unordered upserts, returning the keys that failed"""
+    from pymongo import UpdateOne
+    from pymongo.errors import BulkWriteError
+    
+    keys = list(increments)
+    try:
+        await collection.bulk_write(
+            [UpdateOne(increments[key][0], {"$inc": increments[key][1]}, upsert=True) for key in keys],
+            ordered=False
+        )
+        return set()
+    except BulkWriteError as e:
+        # The other upserts were applied, so only these may be retried
+        return {keys[error["index"]] for error in e.details.get("writeErrors", [])}
+
+async def save_download_buckets(counts):
+    """Add {(unique_id, day, hour): count} to the bucket documents, returning the counts not written"""
+    increments = {}
+    for (unique_id, day, hour), count in counts.items():
+        _, inc = increments.setdefault((unique_id, day), ({"unique_id": unique_id, "day": day}, {"total": 0}))
+        inc["total"] += count
+        inc[f"hours.{hour}"] = inc.get(f"hours.{hour}", 0) + count
+    
+    failed = await upsert_increments(download_stats_collection, increments)
+    return {key: count for key, count in counts.items() if key[:2] in failed}
+
+async def save_daily_rollups(counts):
+    """Add {(day, unique_id): count} to the daily rollup documents, returning the counts not written"""
+    increments = {}
+    for (day, unique_id), count in counts.items():
+        _, inc = increments.setdefault(day, ({"day": day}, {"total": 0}))
+        inc["total"] += count
+        inc[f"files.{unique_id}"] = count
+    
+    failed = await upsert_increments(daily_stats_collection, increments)
+    return {key: count for key, count in counts.items() if key[0] in failed}
+
+async def get_download_history(unique_id, days=7):
+    """Get a file's daily download totals, oldest first"""
+    try:
+        since = start_of_day(datetime.utcnow()) - timedelta(days=days - 1)
+        return await download_stats_collection.find(
+            {"unique_id": unique_id, "day": {"$gte": since}},
+            {"_id": 0, "day": 1, "total": 1}
+        ).sort("day", 1).to_list(days)
+    except Exception as e:
+        logger.error(f"Error getting download history: {e}")
+        return []
+
+async def get_trending_files(days=7, limit=10):
+    """Get the most downloaded files over the last days from the daily rollups"""
+    since = start_of_day(datetime.utcnow()) - timedelta(days=days - 1)
+    downloads = {}
+    async for daily in daily_stats_collection.find(
+        {"day": {"$gte": since}},
+        {"_id": 0, "files": 1}
+    ):
+        for unique_id, count in daily.get("files", {}).items():
+            downloads[unique_id] = downloads.get(unique_id, 0) + count
+    trending = sorted(downloads.items(), key=lambda item: item[1], reverse=True)[:limit]
+    
+    names = {
+        file["unique_id"]: file["file_name"]
+        async for file in files_collection.find(
+            {"unique_id": {"$in": [unique_id for unique_id, _ in trending]}},
+            {"_id": 0, "unique_id": 1, "file_name": 1}
+        )
+    }
+    return [
+        {"unique_id": unique_id, "file_name": names[unique_id], "downloads": count}
+        for unique_id, count in trending if unique_id in names
+    ]
+
+# Database functions for broadcast
+async def create_broadcast(admin_id, chat_id, message_id, status_message_id):
+    """Save a new broadcast of chat_id/message_id"""
+    try:
+        broadcast = {
+            "broadcast_id": generate_unique_id(),
+            "admin_id": admin_id,
+            "chat_id": chat_id,
+            "message_id": message_id,
+            "status_message_id": status_message_id,
+            "status": "running",
+            "last_user_id": None,
+            "sent": 0,
+            "blocked": 0,
+            "failed": 0,
+            "created_at": datetime.utcnow()
+        }
+        await broadcasts_collection.insert_one(broadcast)
+        return broadcast
+    except Exception as e:
+        logger.error(f"Error saving broadcast: {e}")
+        return None
+
+async def save_broadcast_progress(broadcast_id, last_user_id, sent, blocked, failed):
+    """Checkpoint a broadcast after a batch"""
+    await broadcasts_collection.update_one(
+        {"broadcast_id": broadcast_id},
+        {
+            "$set": {"last_user_id": last_user_id, "updated_at": datetime.utcnow()},
+            "$inc": {"sent": sent, "blocked": blocked, "failed": failed}
+        }
+    )
+
+async def update_broadcast_status(broadcast_id, status):
+    """Update broadcast status"""
+    try:
+        await broadcasts_collection.update_one(
+            {"broadcast_id": broadcast_id},
+            {"$set": {"status": status, "updated_at": datetime.utcnow()}}
+        )
+    except Exception as e:
+        logger.error(f"Error updating broadcast: {e}")
+
+async def get_broadcast(broadcast_id):
+    """Get broadcast"""
+    return await broadcasts_collection.find_one({"broadcast_id": broadcast_id})
+
+async def get_running_broadcasts():
+    """Get broadcasts that were still running when the bot stopped"""
+    try:
+        return await broadcasts_collection.find({"status": "running"}).to_list(None)
+    except Exception as e:
+        logger.error(f"Error getting broadcasts: {e}")
+        return []
+
+# Database functions for rename
+async def save_rename_task(user_id, file_id, file_name, file_size, message_id):
+    """Save rename task"""
+    try:
+        task_data = {
+            "task_id": generate_unique_id(),
+            "user_id": user_id,
+            "file_id": file_id,
+            "file_name": file_name,
+            "file_size": file_size,
+            "message_id": message_id,
+            "status": "pending",
+            "created_at": datetime.utcnow()
+        }
+        result = await rename_collection.insert_one(task_data)
+        return task_data["task_id"]
+    except Exception as e:
+        logger.error(f"Error saving rename task: {e}")
+        return None
+
+async def update_rename_status(task_id, status):
+    """Update rename task status"""
+    try:
+        await rename_collection.update_one(
+            {"task_id": task_id},
+            {"$set": {"status": status}}
+        )
+    except Exception as e:
+        logger.error(f"Error updating rename task: {e}")
+
+async def get_rename_task(task_id):
+    """Get rename task"""
+    try:
+        return await rename_collection.find_one({"task_id": task_id})
+    except Exception as e:
+        logger.error(f"Error getting rename task: {e}")
+        return None
@@ -1,18 +1,23 @@
+import time
+_module_started = time.perf_counter()
+
 import os
+import sys
 import logging
 import asyncio
-from datetime import datetime
 from pyrogram import Client, filters, idle
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
-from pyrogram.errors import FloodWait
-from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import MongoClient
-import motor.motor_asyncio
-import time
-import random
-import string
-import humanize
 from config import Config
+from database import (
+    get_mongo_client, ensure_indexes, upgrade_file_documents, search_ready,
+    save_file_to_db, get_file_for_download, get_file_info,
+    get_user_files, get_stats, save_user, search_files,
+    save_search, get_search_query,
+    save_rename_task, update_rename_status, get_rename_task, create_broadcast,
+    get_download_history
+)
+from broadcast import start_broadcast, resume_broadcasts
+from analytics import record_download, flush_downloads, periodic_flush, history_chart, get_trending
 
 # Configure logging
 logging.basicConfig(
@@ -29,24 +34,10 @@ app = Client(
     bot_token=Config.BOT_TOKEN
 )
 
-# MongoDB connections
-mongo_client = AsyncIOMotorClient(Config.MONGODB_URI)
-file_store_db = mongo_client[Config.FILE_STORE_DB_NAME]
-file_rename_db = mongo_client[Config.FILE_RENAME_DB_NAME]
-
-# Collections
-files_collection = file_store_db.files
-users_collection = file_store_db.users
-rename_collection = file_rename_db.rename_tasks
-batch_collection = file_rename_db.batch_tasks
-
 # Helper functions
-def generate_unique_id():
-    """Generate unique ID for files"""
-    return ''.join(random.choices(string.ascii_lowercase + string.digits, k=10))
-
 def get_size(size):
     """Get human readable size"""
+    import humanize
     return humanize.naturalsize(size)
 
 def get_progress_bar(percentage):
@@ -54,99 +45,6 @@ def get_progress_bar(percentage):
     completed = int(percentage / 10)
     return "●" * completed + "○" * (10 - completed)
 
-# Database functions for file store
-async def save_file_to_db(message, file_id, file_name, file_size, mime_type):
-    """Save file information to database"""
-    try:
-        file_data = {
-            "file_id": file_id,
-            "unique_id": generate_unique_id(),
-            "file_name": file_name,
-            "file_size": file_size,
-            "mime_type": mime_type,
-            "message_id": message.id,
-            "chat_id": message.chat.id,
-            "uploaded_by": message.from_user.id if message.from_user else None,
-            "uploaded_at": datetime.utcnow(),
-            "download_count": 0
-        }
-        result = await files_collection.insert_one(file_data)
-        return file_data["unique_id"]
-    except Exception as e:
-        logger.error(f"Error saving file: {e}")
-        return None
-
-async def get_file_from_db(unique_id):
-    """Get file information from database"""
-    try:
-        file_data = await files_collection.find_one({"unique_id": unique_id})
-        if file_data:
-            await files_collection.update_one(
-                {"unique_id": unique_id},
-                {"$inc": {"download_count": 1}}
-            )
-        return file_data
-    except Exception as e:
-        logger.error(f"Error getting file: {e}")
-        return None
-
-async def save_user(user_id, username=None, first_name=None, last_name=None):
-    """Save user information"""
-    try:
-        user_data = {
-            "user_id": user_id,
-            "username": username,
-            "first_name": first_name,
-            "last_name": last_name,
-            "joined_at": datetime.utcnow(),
-            "last_active": datetime.utcnow()
-        }
-        await users_collection.update_one(
-            {"user_id": user_id},
-            {"$set": user_data},
-            upsert=True
-        )
-    except Exception as e:
-        logger.error(f"Error saving user: {e}")
-
-# Database functions for rename
-async def save_rename_task(user_id, file_id, file_name, file_size, message_id):
-    """Save rename task"""
-    try:
-        task_data = {
-            "task_id": generate_unique_id(),
-            "user_id": user_id,
-            "file_id": file_id,
-            "file_name": file_name,
-            "file_size": file_size,
-            "message_id": message_id,
-            "status": "pending",
-            "created_at": datetime.utcnow()
-        }
-        result = await rename_collection.insert_one(task_data)
-        return task_data["task_id"]
-    except Exception as e:
-        logger.error(f"Error saving rename task: {e}")
-        return None
-
-async def update_rename_status(task_id, status):
-    """Update rename task status"""
-    try:
-        await rename_collection.update_one(
-            {"task_id": task_id},
-            {"$set": {"status": status}}
-        )
-    except Exception as e:
-        logger.error(f"Error updating rename task: {e}")
-
-async def get_rename_task(task_id):
-    """Get rename task"""
-    try:
-        return await rename_collection.find_one({"task_id": task_id})
-    except Exception as e:
-        logger.error(f"Error getting rename task: {e}")
-        return None
-
 # Command handlers
 @app.on_message(filters.command("start"))
 async def start_command(client, message):
@@ -180,6 +78,8 @@ I'm an Advanced File Store & Rename Bot with powerful features.
 /about - About bot
 /batch - Batch operations
 /myfiles - Your stored files
+/search - Search your files
+/trending - Most downloaded this week
 
 Click below buttons to learn more!
 """
@@ -193,6 +93,9 @@ Click below buttons to learn more!
             InlineKeyboardButton("📊 Statistics", callback_data="stats"),
             InlineKeyboardButton("👤 My Files", callback_data="my_files")
         ],
+        [
+            InlineKeyboardButton("🔥 Trending", callback_data="trending")
+        ],
         [
             InlineKeyboardButton("📢 Channel", url=Config.CHANNEL_URL),
             InlineKeyboardButton("👥 Support", url=Config.SUPPORT_URL)
@@ -235,6 +138,8 @@ async def help_command(client, message):
 
 **🎯 Tips:**
 • Use /myfiles to see your stored files
+• Use /search <name> to find any stored file
+  (matches word starts, e.g. `rep` finds my_report.pdf)
 • Thumbnail must be image file
 • Max file size: 2GB
 • Files stored permanently
@@ -257,33 +162,22 @@ async def stats_command(client, message):
     """Handle /stats command"""
     try:
         # Get statistics
-        total_files = await files_collection.count_documents({})
-        total_users = await users_collection.count_documents({})
-        total_renames = await rename_collection.count_documents({})
-        
-        # Get today's uploads
-        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        today_uploads = await files_collection.count_documents({
-            "uploaded_at": {"$gte": today}
-        })
-        
-        # Get top files
-        top_files = await files_collection.find().sort("download_count", -1).limit(5).to_list(5)
+        stats = await get_stats()
         
         stats_text = f"""
 **📊 Bot Statistics**
 
 **Total Statistics:**
-• Total Files: **{total_files}**
-• Total Users: **{total_users}**
-• Total Renames: **{total_renames}**
-• Today's Uploads: **{today_uploads}**
+• Total Files: **{stats['total_files']}**
+• Total Users: **{stats['total_users']}**
+• Total Renames: **{stats['total_renames']}**
+• Today's Uploads: **{stats['today_uploads']}**
 
 **📈 Top Files:**
 """
         
-        for i, file in enumerate(top_files, 1):
-            stats_text += f"\n{i}. {file['file_name'][:30]}...\n   📥 {file['download_count']} downloads"
+        for i, file in enumerate(stats["top_files"], 1):
+            stats_text += f"\n{i}. {file['file_name'][:30]}...\n   📥 {file.get('download_count', 0)} downloads"
         
         buttons = [
             [
@@ -300,15 +194,46 @@ async def stats_command(client, message):
         logger.error(f"Error in stats: {e}")
         await message.reply_text("❌ Error fetching statistics!")
 
+@app.on_message(filters.command("trending"))
+async def trending_command(client, message):
+    """Handle /trending command"""
+    try:
+        trending = await get_trending()
+        
+        if not trending:
+            await message.reply_text(f"🔥 No downloads in the last {Config.TRENDING_DAYS} days!")
+            return
+        
+        text = f"**🔥 Trending (last {Config.TRENDING_DAYS} days)**\n\n"
+        buttons = []
+        for i, file in enumerate(trending, 1):
+            text += f"{i}. **{file['file_name'][:40]}**\n"
+            text += f"   📥 {file['downloads']} downloads\n\n"
+            buttons.append([
+                InlineKeyboardButton(f"📥 {file['file_name'][:25]}", callback_data=f"download_{file['unique_id']}"),
+                InlineKeyboardButton("ℹ️ Info", callback_data=f"info_{file['unique_id']}")
+            ])
+        
+        buttons.append([
+            InlineKeyboardButton("🔄 Refresh", callback_data="trending"),
+            InlineKeyboardButton("◀️ Back", callback_data="back_to_start")
+        ])
+        
+        await message.reply_text(
+            text,
+            reply_markup=InlineKeyboardMarkup(buttons)
+        )
+    except Exception as e:
+        logger.error(f"Error in trending: {e}")
+        await message.reply_text("❌ Error fetching trending files!")
+
 @app.on_message(filters.command("myfiles"))
 async def my_files_command(client, message):
     """Handle /myfiles command"""
     user_id = message.from_user.id
     
     try:
-        user_files = await files_collection.find(
-            {"uploaded_by": user_id}
-        ).sort("uploaded_at", -1).limit(10).to_list(10)
+        user_files = await get_user_files(user_id)
         
         if not user_files:
             await message.reply_text("📁 You haven't uploaded any files yet!")
@@ -318,7 +243,7 @@ async def my_files_command(client, message):
         for i, file in enumerate(user_files, 1):
             size = get_size(file['file_size'])
             text += f"{i}. **{file['file_name'][:40]}**\n"
-            text += f"   📥 {file['download_count']} downloads | 💾 {size}\n"
+            text += f"   📥 {file.get('download_count', 0)} downloads | 💾 {size}\n"
             text += f"   🔗 `{file['unique_id']}`\n\n"
         
         buttons = [[
@@ -333,6 +258,69 @@ async def my_files_command(client, message):
         logger.error(f"Error in myfiles: {e}")
         await message.reply_text("❌ Error fetching your files!")
 
+async def send_search_results(message, user_id, query, page=0, edit=False, search_id=None):
+    """Send or edit a page of search results"""
+    results, total = await search_files(user_id, query, page)
+    
+    if not total:
+        if search_ready():
+            text = f"🔍 No files found for `{query}`"
+        else:
+            text = (
+                f"🔍 No files found for `{query}` yet.\n\n"
+                "⏳ Older files are still being added to search, please try again shortly."
+            )
+        buttons = [[InlineKeyboardButton("📁 My Files", callback_data="my_files")]]
+    else:
+        pages = (total + Config.SEARCH_PAGE_SIZE - 1) // Config.SEARCH_PAGE_SIZE
+        text = f"**🔍 Results for** `{query}`\n"
+        text += f"Page {page + 1}/{pages} • {total} files\n\n"
+        buttons = []
+        for i, file in enumerate(results, page * Config.SEARCH_PAGE_SIZE + 1):
+            text += f"{i}. **{file['file_name'][:40]}**\n"
+            text += f"   💾 {get_size(file['file_size'])} | 🔗 `{file['unique_id']}`\n\n"
+            buttons.append([
+                InlineKeyboardButton(f"📥 {file['file_name'][:25]}", callback_data=f"download_{file['unique_id']}"),
+                InlineKeyboardButton("ℹ️ Info", callback_data=f"info_{file['unique_id']}")
+            ])
+        
+        if pages > 1:
+            # The query can exceed Telegram's 64 byte callback data limit,
+            # so page buttons refer to a saved copy of it
+            if search_id is None:
+                search_id = await save_search(user_id, query)
+            nav = []
+            if page > 0:
+                nav.append(InlineKeyboardButton("◀️ Prev", callback_data=f"search_{search_id}_{page - 1}"))
+            if page + 1 < pages:
+                nav.append(InlineKeyboardButton("Next ▶️", callback_data=f"search_{search_id}_{page + 1}"))
+            buttons.append(nav)
+    
+    if edit:
+        await message.edit_text(text, reply_markup=InlineKeyboardMarkup(buttons))
+    else:
+        await message.reply_text(text, reply_markup=InlineKeyboardMarkup(buttons))
+
+@app.on_message(filters.command("search"))
+async def search_command(client, message):
+    """Handle /search command"""
+    if len(message.command) < 2:
+        await message.reply_text(
+            "🔍 **Please provide search terms!**\n\n"
+            "Usage: `/search terms`\n"
+            "Example: `/search report 2024`\n\n"
+            "Terms need at least 2 characters and match the start of words."
+        )
+        return
+    
+    query = " ".join(message.command[1:])
+    
+    try:
+        await send_search_results(message, message.from_user.id, query)
+    except Exception as e:
+        logger.error(f"Error in search: {e}")
+        await message.reply_text("❌ Error searching your files!")
+
 @app.on_message(filters.command("rename"))
 async def rename_command(client, message):
     """Handle /rename command"""
@@ -515,6 +503,29 @@ Choose batch operation:
         reply_markup=InlineKeyboardMarkup(buttons)
     )
 
+@app.on_message(filters.command("broadcast") & filters.user(Config.ADMINS))
+async def broadcast_command(client, message):
+    """Handle /broadcast command (admins only)"""
+    if not message.reply_to_message:
+        await message.reply_text(
+            "📢 **Reply to the message you want to broadcast!**\n\n"
+            "It will be copied to every active user."
+        )
+        return
+    
+    status = await message.reply_text("📢 Starting broadcast...")
+    broadcast = await create_broadcast(
+        message.from_user.id,
+        message.chat.id,
+        message.reply_to_message.id,
+        status.id
+    )
+    
+    if broadcast:
+        start_broadcast(client, broadcast)
+    else:
+        await status.edit_text("❌ Error starting broadcast!")
+
 # Callback handlers
 @app.on_callback_query()
 async def handle_callbacks(client, callback_query):
@@ -568,14 +579,18 @@ async def handle_callbacks(client, callback_query):
         elif data == "my_files":
             await my_files_command(client, callback_query.message)
         
+        elif data == "trending":
+            await trending_command(client, callback_query.message)
+        
         elif data == "back_to_start":
             await start_command(client, callback_query.message)
         
         elif data.startswith("download_"):
             unique_id = data.split("_")[1]
-            file_data = await get_file_from_db(unique_id)
+            file_data = await get_file_for_download(unique_id)
             
             if file_data:
+                record_download(unique_id)
                 try:
                     await client.send_cached_media(
                         chat_id=user_id,
@@ -590,18 +605,22 @@ async def handle_callbacks(client, callback_query):
         
         elif data.startswith("info_"):
             unique_id = data.split("_")[1]
-            file_data = await get_file_from_db(unique_id)
+            file_data = await get_file_info(unique_id)
             
             if file_data:
+                history = await get_download_history(unique_id, Config.TRENDING_DAYS)
                 info_text = f"""
 **📄 File Information**
 
 **Name:** `{file_data['file_name']}`
 **Size:** {get_size(file_data['file_size'])}
-**Type:** {file_data['mime_type']}
-**Downloads:** {file_data['download_count']}
+**Type:** {file_data.get('mime_type', 'unknown')}
+**Downloads:** {file_data.get('download_count', 0)}
 **Uploaded:** {file_data['uploaded_at'].strftime('%Y-%m-%d %H:%M')}
 **File ID:** `{unique_id}`
+
+**📈 Daily Downloads:**
+{history_chart(history, Config.TRENDING_DAYS)}
 """
                 await callback_query.message.edit_text(
                     info_text,
@@ -613,6 +632,17 @@ async def handle_callbacks(client, callback_query):
             else:
                 await callback_query.answer("❌ File not found!")
         
+        elif data.startswith("search_"):
+            _, search_id, page = data.split("_")
+            query = await get_search_query(search_id)
+            
+            if query:
+                await send_search_results(
+                    callback_query.message, user_id, query, int(page), edit=True, search_id=search_id
+                )
+            else:
+                await callback_query.answer("⌛ Search expired, please run /search again!", show_alert=True)
+        
         elif data.startswith("copy_"):
             unique_id = data.split("_")[1]
             await callback_query.answer(f"ID: {unique_id}", show_alert=True)
@@ -681,23 +711,76 @@ async def periodic_health_check():
             logger.error(f"Health check failed: {e}")
             await asyncio.sleep(60)
 
+# Startup
+async def warm_mongo():
+    """Open the MongoDB connection pool ahead of the first handler"""
+    try:
+        await get_mongo_client().admin.command('ping')
+        logger.info("MongoDB connected successfully")
+    except Exception as e:
+        logger.error(f"MongoDB connection failed: {e}")
+
+async def prepare_database():
+    """Build indexes, then bring older file documents up to date"""
+    await ensure_indexes()
+    await upgrade_file_documents()
+
+async def timed(phases, name, coro):
+    """Await coro and record how long it took under name"""
+    started = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        phases.append((name, time.perf_counter() - started))
+
+def print_startup_profile(phases, total):
+    """Print per-phase startup timings"""
+    print("Startup profile:")
+    for name, seconds in phases:
+        print(f"  {name:<16} {seconds * 1000:>9.1f} ms")
+    print(f"  {'total':<16} {total * 1000:>9.1f} ms")
+
 # Main function
-async def main():
+async def main(profile_startup=False):
     """Main function to start bot"""
     logger.info("Starting Advanced Bot...")
+    phases = [("module_load", _module_loaded - _module_started)]
+    started = time.perf_counter()
     
-    # Start bot
-    await app.start()
+    # Start bot while the MongoDB pool warms up in the background
+    await asyncio.gather(
+        timed(phases, "bot_start", app.start()),
+        timed(phases, "mongo_warmup", warm_mongo())
+    )
     
-    # Start health check task
+    # Start health check and download stats tasks
     asyncio.create_task(periodic_health_check())
+    asyncio.create_task(periodic_flush())
     
     logger.info("Bot started successfully!")
     
+    if profile_startup:
+        total = phases[0][1] + time.perf_counter() - started
+        print_startup_profile(phases, total)
+        await app.stop()
+        return
+    
+    # Index builds and the schema backfill can take a while on first
+    # deploy, so they run in the background instead of holding up startup
+    asyncio.create_task(prepare_database())
+    
+    # Pick up broadcasts interrupted by a restart
+    await resume_broadcasts(app)
+    
     # Keep bot running
     await idle()
     
+    # Write out download counts still buffered in memory
+    await flush_downloads()
+    
     logger.info("Bot stopped!")
 
+_module_loaded = time.perf_counter()
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(main(profile_startup="--profile-startup" in sys.argv[1:]))